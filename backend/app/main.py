@@ -6,6 +6,7 @@ from app.routes.upload_document import upload_document
 from app.services.blob_service import get_blob_service_client
 from app.routes.autocomplete import autocomplete
 from app.routes.clear_data import clear_data
+from app.routes.retry_ingestion import retry_ingestion
 
 # Load environment variables
 load_dotenv()
@@ -33,6 +34,10 @@ def upload_document_route(req: func.HttpRequest) -> func.HttpResponse:
 def autocomplete_route(req: func.HttpRequest) -> func.HttpResponse:
     return autocomplete(req)
 
+@app.route(route="RetryIngestion", auth_level=func.AuthLevel.ANONYMOUS)
+def retry_ingestion_route(req: func.HttpRequest) -> func.HttpResponse:
+    return retry_ingestion(req)
+
 @app.route(route="ClearData", auth_level=func.AuthLevel.ANONYMOUS)
 def clear_data_route(req: func.HttpRequest) -> func.HttpResponse:
     return clear_data(req)
\ No newline at end of file
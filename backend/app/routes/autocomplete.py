@@ -3,10 +3,20 @@ import logging
 import azure.functions as func
 from app.utils.cors import cors_headers
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from app.services.vector_service import search_embeddings
+from app.services.schema_service import verify_schema
+from app.services.vector_service import search_embeddings, get_active_index, requested_dimensions
+from app.services.openai_scheduler import get_openai_scheduler, INTERACTIVE
 import os
 import json
-from typing import List, Dict, Any
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+# Room left for the completion when estimating the tokens a chat call will use
+COMPLETION_TOKEN_ESTIMATE = 512
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (about four characters per token) for rate limiting."""
+    return len(text) // 4 + 1
 
 def format_context(results: List[tuple]) -> str:
     context_parts = []
@@ -33,6 +43,45 @@ def format_response(response_text: str, search_results: List[tuple]) -> Dict[str
         "sources": sources
     }
 
+def parse_string_list(value: Any, field_name: str) -> Optional[List[str]]:
+    """Accept a single string or a list of strings for a filter field."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return value
+    raise ValueError(f"'{field_name}' must be a string or a list of strings.")
+
+
+def parse_timestamp(value: Any, field_name: str) -> Optional[datetime]:
+    """Parse an ISO 8601 timestamp from a filter field."""
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"'{field_name}' must be an ISO 8601 timestamp.")
+
+
+def parse_search_filters(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract the optional search filters from the request body."""
+    filters = body.get("filters") or {}
+    if not isinstance(filters, dict):
+        raise ValueError("'filters' must be an object.")
+
+    metadata_filter = filters.get("metadata")
+    if metadata_filter is not None and not isinstance(metadata_filter, dict):
+        raise ValueError("'metadata' must be an object.")
+
+    return {
+        "document_names": parse_string_list(filters.get("documentNames"), "documentNames"),
+        "file_types": parse_string_list(filters.get("fileTypes"), "fileTypes"),
+        "uploaded_after": parse_timestamp(filters.get("uploadedAfter"), "uploadedAfter"),
+        "uploaded_before": parse_timestamp(filters.get("uploadedBefore"), "uploadedBefore"),
+        "metadata_filter": metadata_filter
+    }
+
 def autocomplete(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Processing autocomplete request with RAG.")
 
@@ -41,6 +90,8 @@ def autocomplete(req: func.HttpRequest) -> func.HttpResponse:
         return func.HttpResponse(status_code=200, headers=cors_headers)
 
     try:
+        verify_schema()
+
         # Parse request body
         body = req.get_json()
         query = body.get("query", "")
@@ -52,19 +103,43 @@ def autocomplete(req: func.HttpRequest) -> func.HttpResponse:
                 headers={**cors_headers, 'Content-Type': 'application/json'}
             )
 
+        try:
+            search_filters = parse_search_filters(body)
+        except ValueError as e:
+            return func.HttpResponse(
+                json.dumps({"error": str(e)}),
+                status_code=400,
+                headers={**cors_headers, 'Content-Type': 'application/json'}
+            )
+
         # Fetch API key from environment variables
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OpenAI API key not found in environment variables.")
 
-        # Initialize embedding model
-        embeddings_model = OpenAIEmbeddings(api_key=api_key)
+        # Queries go through the shared scheduler ahead of bulk ingestion
+        scheduler = get_openai_scheduler()
+
+        # Embed the query with the model the active index was built with, and
+        # search that same index even if a re-index switches over meanwhile
+        active_index = get_active_index()
+        embeddings_model = OpenAIEmbeddings(
+            api_key=api_key,
+            model=active_index["model"],
+            dimensions=requested_dimensions(active_index["model"], active_index["dimensions"]),
+            max_retries=0
+        )
 
         # Generate embedding for the query
-        query_embedding = embeddings_model.embed_query(query)
+        query_embedding = scheduler.run(
+            lambda: embeddings_model.embed_query(query),
+            priority=INTERACTIVE,
+            tokens=estimate_tokens(query),
+            kind="query_embeddings"
+        )
 
         # Search for relevant documents
-        search_results = search_embeddings(query_embedding)
+        search_results = search_embeddings(query_embedding, index=active_index, **search_filters)
 
         if not search_results:
             # No documents found; proceed with query-only prompt
@@ -77,10 +152,15 @@ If you cannot provide a confident answer, acknowledge the lack of information.
 """
 
             # Initialize LLM
-            llm = ChatOpenAI(api_key=api_key, temperature=0.5)
+            llm = ChatOpenAI(api_key=api_key, temperature=0.5, max_retries=0)
 
             # Generate response
-            ai_message = llm.invoke(prompt)
+            ai_message = scheduler.run(
+                lambda: llm.invoke(prompt),
+                priority=INTERACTIVE,
+                tokens=estimate_tokens(prompt) + COMPLETION_TOKEN_ESTIMATE,
+                kind="chat"
+            )
             response_text = ai_message.content if hasattr(ai_message, "content") else "Unable to generate response."
 
             return func.HttpResponse(
@@ -125,10 +205,15 @@ The system uses "cloud storage" ([Document: sample.pdf]).
 """
 
         # Initialize LangChain OpenAI instance
-        llm = ChatOpenAI(api_key=api_key, temperature=0.5)
+        llm = ChatOpenAI(api_key=api_key, temperature=0.5, max_retries=0)
 
         # Generate response with context
-        ai_message = llm.invoke(prompt)
+        ai_message = scheduler.run(
+            lambda: llm.invoke(prompt),
+            priority=INTERACTIVE,
+            tokens=estimate_tokens(prompt) + COMPLETION_TOKEN_ESTIMATE,
+            kind="chat"
+        )
 
         # Extract the content of the AIMessage
         if hasattr(ai_message, "content"):
@@ -0,0 +1,155 @@
+# routes/retry_ingestion.py
+import logging
+from typing import Optional
+import azure.functions as func
+from app.utils.cors import cors_headers
+from app.routes.upload_document import DocumentProcessor, DocumentChunk, ingest_pending_chunks, ingestion_response
+from app.services.ingestion_service import (
+    IngestionInProgressError,
+    ingestion_lock,
+    get_ingestion_document,
+    get_latest_document,
+    get_unfinished_chunks,
+    mark_document_completed,
+    refresh_document_status
+)
+from app.services.schema_service import verify_schema
+from app.services.vector_service import get_active_index, get_embedding_index, document_is_indexed
+
+def resume_document(document: dict) -> func.HttpResponse:
+    """Embed and store the unfinished chunks of a document; the caller holds its ingestion lock."""
+    unfinished = get_unfinished_chunks(document["id"])
+    if not unfinished:
+        refresh_document_status(document["id"])
+        return ingestion_response(
+            f"Document {document['document_name']} is already fully processed",
+            status_code=200,
+            document_id=document["id"]
+        )
+
+    # A re-index rebuilt the whole document from its extracted text into the active
+    # index; finishing it in the old table would only pay for chunks nobody searches
+    active_index = get_active_index()
+    if document["index_table"] != active_index["table_name"]:
+        if not document_is_indexed(active_index["table_name"], document["document_name"]):
+            return ingestion_response(
+                f"Document {document['document_name']} was started on {document['index_table']}, which is "
+                f"no longer active, and is not in {active_index['table_name']} yet; re-index or re-upload it",
+                status_code=409,
+                document_id=document["id"]
+            )
+        mark_document_completed(document["id"])
+        return ingestion_response(
+            f"Document {document['document_name']} was re-indexed into {active_index['table_name']}; "
+            "nothing left to process",
+            status_code=200,
+            document_id=document["id"]
+        )
+
+    logging.info(f"Resuming {len(unfinished)} chunks of {document['document_name']} (document id {document['id']})")
+
+    pending = [
+        (
+            chunk["chunk_idx"],
+            DocumentChunk(
+                content=chunk["content"],
+                start_idx=chunk["start_idx"],
+                end_idx=chunk["end_idx"],
+                metadata={"chunk_size": chunk["chunk_size"]}
+            ),
+            chunk["status"]
+        )
+        for chunk in unfinished
+    ]
+
+    # Finish the document against the index it was started on, with the same model
+    index = get_embedding_index(document["index_table"])
+    if not index:
+        return ingestion_response(
+            f"Embedding index {document['index_table']} no longer exists; re-upload the document",
+            status_code=409,
+            document_id=document["id"]
+        )
+
+    failed_chunks = ingest_pending_chunks(
+        DocumentProcessor.for_index(index),
+        document_id=document["id"],
+        document_name=document["document_name"],
+        mime_type=document["file_type"],
+        blob_url=document["blob_url"],
+        index_table=index["table_name"],
+        pending=pending
+    )
+    refresh_document_status(document["id"])
+
+    if failed_chunks:
+        logging.error(f"Failed to process chunks: {failed_chunks}")
+        return ingestion_response(
+            f"Document processed with {len(failed_chunks)} failed chunks; retry it to finish",
+            status_code=207,
+            document_id=document["id"]
+        )
+
+    return ingestion_response(
+        f"Document {document['document_name']} processed successfully",
+        status_code=200,
+        document_id=document["id"]
+    )
+
+def find_document(body: dict) -> Optional[dict]:
+    """
+    Looks up the ingestion record named by the request: a documentId, or a
+    documentName resolved to that document's latest upload.
+    Raises ValueError if neither is given.
+    """
+    if body.get("documentId") is not None:
+        try:
+            return get_ingestion_document(int(body["documentId"]))
+        except (ValueError, TypeError):
+            raise ValueError("documentId must be numeric")
+
+    document_name = body.get("documentName")
+    if isinstance(document_name, str) and document_name:
+        return get_latest_document(document_name)
+
+    raise ValueError("A documentId or documentName is required")
+
+def retry_ingestion(req: func.HttpRequest) -> func.HttpResponse:
+    """Resume ingestion of a partially processed document, redoing only its unfinished chunks."""
+    # Handle CORS preflight
+    if req.method == 'OPTIONS':
+        return func.HttpResponse(status_code=200, headers=cors_headers)
+
+    document = None
+    try:
+        verify_schema()
+
+        try:
+            body = req.get_json()
+            if not isinstance(body, dict):
+                raise ValueError("The request body must be a JSON object")
+            document = find_document(body)
+        except ValueError as e:
+            return ingestion_response(str(e), status_code=400)
+
+        if not document:
+            return ingestion_response("No ingestion record found for that document", status_code=404)
+
+        # Only one request may process a document at a time
+        try:
+            with ingestion_lock(document["id"]):
+                return resume_document(document)
+        except IngestionInProgressError as e:
+            return ingestion_response(
+                f"{str(e)}; try again once it finishes",
+                status_code=409,
+                document_id=document["id"]
+            )
+
+    except Exception as e:
+        logging.error(f"Error retrying ingestion: {str(e)}")
+        return ingestion_response(
+            f"Error retrying ingestion: {str(e)}",
+            status_code=500,
+            document_id=document["id"] if document else None
+        )
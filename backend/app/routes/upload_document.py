@@ -1,7 +1,9 @@
 # routes/upload_document.py
 import logging
+import json
 import azure.functions as func
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from datetime import datetime
 import numpy as np
 from openai import OpenAI
 import tiktoken
@@ -10,11 +12,28 @@ from concurrent.futures import ThreadPoolExecutor
 import PyPDF2
 import io
 import mimetypes
-from app.services.vector_service import insert_embedding
-from psycopg2.extras import Json
-import json
 from app.utils.cors import cors_headers
-from app.services.blob_service import upload_to_blob
+from app.services.blob_service import upload_to_blob, upload_extracted_text, EXTRACTED_TEXT_CONTAINER
+from app.services.schema_service import verify_schema
+from app.services.vector_service import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_EMBEDDING_MODEL,
+    get_active_index,
+    replace_document_embeddings,
+    requested_dimensions
+)
+from app.services.openai_scheduler import get_openai_scheduler, BULK
+from app.services.ingestion_service import (
+    CHUNK_EXTRACTED,
+    IngestionInProgressError,
+    ingestion_lock,
+    create_ingestion_document,
+    get_ingestion_document,
+    save_chunk_embedding,
+    store_chunk,
+    mark_chunk_failed,
+    refresh_document_status
+)
 
 @dataclass
 class DocumentChunk:
@@ -39,10 +58,24 @@ def prepare_metadata(file_name: str, mime_type: str, chunk: DocumentChunk, blob_
 
 
 class DocumentProcessor:
-    def __init__(self, max_chunk_size: int = 900):
+    def __init__(
+        self,
+        max_chunk_size: int = DEFAULT_CHUNK_SIZE,
+        model: str = DEFAULT_EMBEDDING_MODEL,
+        dimensions: Optional[int] = None
+    ):
         self.max_chunk_size = max_chunk_size
+        self.model = model
+        self.dimensions = dimensions
         self.encoding = tiktoken.get_encoding("cl100k_base")
-        self.client = OpenAI()
+        # Retries are handled by the shared scheduler rather than the client
+        self.client = OpenAI(max_retries=0)
+        self.scheduler = get_openai_scheduler()
+
+    @classmethod
+    def for_index(cls, index: dict) -> "DocumentProcessor":
+        """Processor that chunks and embeds the way an embedding index was built."""
+        return cls(max_chunk_size=index["chunk_size"], model=index["model"], dimensions=index["dimensions"])
 
     def extract_text_from_pdf(self, file_content: bytes) -> str:
         """Extract text content from PDF file and clean up formatting."""
@@ -131,25 +164,134 @@ class DocumentProcessor:
 
         return chunks
 
-    def generate_embeddings(self, chunks: List[DocumentChunk]) -> List[np.ndarray]:
-        """Generate embeddings for chunks."""
-        embeddings = []
-        for chunk in chunks:
-            response = self.client.embeddings.create(
+    def generate_embedding(self, chunk: DocumentChunk) -> np.ndarray:
+        """Generate the embedding for a single chunk at bulk priority."""
+        options = {}
+        dimensions = requested_dimensions(self.model, self.dimensions)
+        if dimensions:
+            options["dimensions"] = dimensions
+
+        response = self.scheduler.run(
+            lambda: self.client.embeddings.create(
                 input=chunk.content,
-                model="text-embedding-3-small"
+                model=self.model,
+                **options
+            ),
+            priority=BULK,
+            tokens=chunk.metadata.get("chunk_size", self.max_chunk_size),
+            kind="embeddings"
+        )
+        return np.array(response.data[0].embedding)
+
+    def generate_embeddings(self, chunks: List[DocumentChunk]) -> List[np.ndarray]:
+        """Generate embeddings for chunks; the scheduler decides how many run at once."""
+        with ThreadPoolExecutor(max_workers=self.scheduler.max_concurrency) as executor:
+            return list(executor.map(self.generate_embedding, chunks))
+
+def index_document_text(
+    processor: DocumentProcessor,
+    document_name: str,
+    mime_type: str,
+    blob_url: str,
+    text_content: str,
+    table_name: str,
+    uploaded_at: datetime
+) -> int:
+    """
+    Chunk, embed and store a document's text into an embeddings table in one go,
+    replacing any copy already there. Returns the number of chunks stored.
+    """
+    chunks = processor.chunk_document(text_content)
+    embeddings = processor.generate_embeddings(chunks)
+
+    rows = [
+        (
+            embedding.tolist(),
+            prepare_metadata(
+                file_name=document_name,
+                mime_type=mime_type,
+                chunk=chunk,
+                blob_url=blob_url
             )
-            embeddings.append(np.array(response.data[0].embedding))
-        return embeddings
+        )
+        for chunk, embedding in zip(chunks, embeddings)
+    ]
+    replace_document_embeddings(table_name, document_name, rows, uploaded_at)
+    return len(rows)
+
+def ingest_pending_chunks(
+    processor: DocumentProcessor,
+    document_id: int,
+    document_name: str,
+    mime_type: str,
+    blob_url: str,
+    index_table: str,
+    pending: List[Tuple[int, DocumentChunk, str]]
+) -> List[int]:
+    """
+    Embed and store chunks, resuming each from its last checkpointed stage.
+    Chunks already embedded skip the OpenAI call. Returns the indexes of chunks that failed.
+    """
+    def process(chunk_idx: int, chunk: DocumentChunk, status: str):
+        if status == CHUNK_EXTRACTED:
+            embedding = processor.generate_embedding(chunk)
+            if not save_chunk_embedding(document_id, chunk_idx, embedding.tolist()):
+                # Another request got this chunk past extraction first and stores it
+                return
+
+        metadata = prepare_metadata(
+            file_name=document_name,
+            mime_type=mime_type,
+            chunk=chunk,
+            blob_url=blob_url
+        )
+        logging.debug(f"Prepared metadata: {metadata}")
+        store_chunk(document_id, chunk_idx, document_name, metadata, index_table)
+
+    failed_chunks = []
+    with ThreadPoolExecutor(max_workers=processor.scheduler.max_concurrency) as executor:
+        futures = {
+            executor.submit(process, chunk_idx, chunk, status): chunk_idx
+            for chunk_idx, chunk, status in pending
+        }
+
+        # Wait for all chunks to finish; failures keep their checkpoint for a retry
+        for future, chunk_idx in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                logging.error(f"Error processing chunk {chunk_idx}: {str(e)}")
+                failed_chunks.append(chunk_idx)
+                try:
+                    mark_chunk_failed(document_id, chunk_idx, str(e))
+                except Exception as mark_error:
+                    logging.error(f"Error recording failure of chunk {chunk_idx}: {str(mark_error)}")
+
+    return failed_chunks
+
+def ingestion_response(message: str, status_code: int, document_id: Optional[int] = None) -> func.HttpResponse:
+    """JSON response carrying the ingestion document id, so a client can always retry."""
+    payload = {"message": message}
+    if document_id is not None:
+        payload["documentId"] = document_id
+    return func.HttpResponse(
+        json.dumps(payload),
+        status_code=status_code,
+        headers={**cors_headers, 'Content-Type': 'application/json'}
+    )
 
 def upload_document(req: func.HttpRequest, blob_service_client, blob_container_name) -> func.HttpResponse:
     # Handle CORS preflight
     if req.method == 'OPTIONS':
         return func.HttpResponse(status_code=200, headers=cors_headers)
 
+    document_id = None
     try:
-        # Initialize document processor
-        processor = DocumentProcessor()
+        verify_schema()
+
+        # Chunk and embed the way the active index was built
+        active_index = get_active_index()
+        processor = DocumentProcessor.for_index(active_index)
 
         # Get file content
         file = req.files.get('file')
@@ -192,70 +334,76 @@ def upload_document(req: func.HttpRequest, blob_service_client, blob_container_n
                 headers=cors_headers
             )
 
-        # Process document in chunks
+        # Keep the extracted text so re-indexing never has to extract it again
+        text_container_client = blob_service_client.get_container_client(EXTRACTED_TEXT_CONTAINER)
+        text_blob_name = upload_extracted_text(text_container_client, file_name, text_content)
+
+        # Process document in chunks and checkpoint them before any embedding work
         chunks = processor.chunk_document(text_content)
         logging.info(f"Created {len(chunks)} chunks from document")
+        document_id = create_ingestion_document(
+            file_name,
+            mime_type,
+            blob_url,
+            text_blob_name,
+            active_index["table_name"],
+            chunks
+        )
 
-        # Generate embeddings
-        embeddings = processor.generate_embeddings(chunks)
-        logging.info(f"Generated {len(embeddings)} embeddings")
-
-        # Store chunks and embeddings
-        failed_chunks = []
-        with ThreadPoolExecutor() as executor:
-            futures = []
-            for chunk_idx, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                try:
-                    # Prepare metadata with explicit type conversion
-                    metadata = prepare_metadata(
-                        file_name=file_name,
-                        mime_type=mime_type,
-                        chunk=chunk,
-                        blob_url=blob_url
-                    )
-                    logging.debug(f"Prepared metadata: {metadata}")
-
-                    # Verify metadata is JSON serializable
-                    json.dumps(metadata)
-
-                    futures.append(
-                        executor.submit(
-                            insert_embedding,
-                            document_name=file_name,
-                            embedding=embedding.tolist(),
-                            metadata=metadata
-                        )
-                    )
-                except Exception as e:
-                    logging.error(f"Error preparing chunk {chunk_idx}: {str(e)}")
-                    failed_chunks.append(chunk_idx)
-
-            # Wait for all database operations to complete
-            for idx, future in enumerate(futures):
-                try:
-                    future.result()
-                except Exception as e:
-                    logging.error(f"Error inserting chunk {idx}: {str(e)}")
-                    failed_chunks.append(idx)
+        # Generate embeddings and store them, checkpointing each chunk as it goes. The
+        # lock keeps a retry of this document from running alongside the upload.
+        with ingestion_lock(document_id):
+            failed_chunks = ingest_pending_chunks(
+                processor,
+                document_id=document_id,
+                document_name=file_name,
+                mime_type=mime_type,
+                blob_url=blob_url,
+                index_table=active_index["table_name"],
+                pending=[(chunk_idx, chunk, CHUNK_EXTRACTED) for chunk_idx, chunk in enumerate(chunks)]
+            )
+            refresh_document_status(document_id)
+
+            # A re-index may have switched the active index while this upload ran; its
+            # final catch-up can miss an upload this late, so copy the document over here
+            current_index = get_active_index()
+            if current_index["table_name"] != active_index["table_name"]:
+                logging.info(f"Active index moved to {current_index['table_name']}; indexing {file_name} there too")
+                index_document_text(
+                    DocumentProcessor.for_index(current_index),
+                    document_name=file_name,
+                    mime_type=mime_type,
+                    blob_url=blob_url,
+                    text_content=text_content,
+                    table_name=current_index["table_name"],
+                    uploaded_at=get_ingestion_document(document_id)["created_at"]
+                )
 
         if failed_chunks:
             logging.error(f"Failed to process chunks: {failed_chunks}")
-            return func.HttpResponse(
-                f"Document processed with {len(failed_chunks)} failed chunks",
+            return ingestion_response(
+                f"Document processed with {len(failed_chunks)} failed chunks; retry it to finish",
                 status_code=207,
-                headers=cors_headers
+                document_id=document_id
             )
 
-        return func.HttpResponse(
+        return ingestion_response(
             f"Document {file_name} processed successfully",
             status_code=200,
-            headers=cors_headers
+            document_id=document_id
+        )
+
+    except IngestionInProgressError as e:
+        return ingestion_response(
+            f"{str(e)} by a retry",
+            status_code=409,
+            document_id=document_id
         )
 
     except Exception as e:
         logging.error(f"Error processing document: {str(e)}")
-        return func.HttpResponse(
+        return ingestion_response(
             f"Error processing document: {str(e)}",
             status_code=500,
-            headers=cors_headers
+            document_id=document_id
         )
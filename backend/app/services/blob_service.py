@@ -2,6 +2,9 @@
 from azure.storage.blob import BlobServiceClient
 import logging
 
+# Container holding the cleaned text extracted from each upload, reused by re-index jobs
+EXTRACTED_TEXT_CONTAINER = "extracted-text"
+
 def get_blob_service_client(connection_string):
     return BlobServiceClient.from_connection_string(connection_string)
 
@@ -46,4 +49,34 @@ def upload_to_blob(container_client, file_name, file_content, mime_type):
 
     logging.info(f"Uploaded file: {file_name} to container: {container_client.container_name}")
 
-    return url
\ No newline at end of file
+    return url
+
+def upload_extracted_text(container_client, file_name, text):
+    """
+    Store the cleaned text extracted from a document so it never has to be extracted again.
+    Returns the name of the text blob.
+    """
+    if not container_client.exists():
+        logging.info(f"Creating container: {container_client.container_name}")
+        container_client.create_container()
+
+    from azure.storage.blob import ContentSettings
+
+    blob_name = f"{file_name}.txt"
+    container_client.get_blob_client(blob_name).upload_blob(
+        data=text.encode('utf-8'),
+        overwrite=True,
+        content_settings=ContentSettings(content_type='text/plain; charset=utf-8')
+    )
+
+    logging.info(f"Uploaded extracted text: {blob_name} to container: {container_client.container_name}")
+
+    return blob_name
+
+def download_blob(container_client, blob_name):
+    """Download the raw bytes of a blob."""
+    return container_client.get_blob_client(blob_name).download_blob().readall()
+
+def download_extracted_text(container_client, blob_name):
+    """Download text previously stored with upload_extracted_text."""
+    return download_blob(container_client, blob_name).decode('utf-8')
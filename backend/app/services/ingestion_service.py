@@ -0,0 +1,334 @@
+# services/ingestion_service.py
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional
+from psycopg2 import sql
+from psycopg2.extras import Json, execute_values
+from app.services.vector_service import connect_to_db
+
+# Chunk lifecycle: each stage is checkpointed so a retry resumes where it stopped
+CHUNK_EXTRACTED = "extracted"
+CHUNK_EMBEDDED = "embedded"
+CHUNK_STORED = "stored"
+
+DOCUMENT_PROCESSING = "processing"
+DOCUMENT_PARTIAL = "partial"
+DOCUMENT_COMPLETED = "completed"
+
+# Advisory lock namespace for documents being processed; the second key is the document id
+INGESTION_LOCK_NAMESPACE = 7262028
+
+class IngestionInProgressError(Exception):
+    """Raised when another request is already processing the same document."""
+
+@contextmanager
+def ingestion_lock(document_id: int):
+    """
+    Holds a session-level advisory lock on a document for the duration of the block,
+    so an upload and its retries never embed or store the same chunks twice.
+    """
+    conn = connect_to_db()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s, %s)", (INGESTION_LOCK_NAMESPACE, document_id))
+            if not cur.fetchone()[0]:
+                raise IngestionInProgressError(f"Document {document_id} is already being processed")
+        try:
+            yield
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s, %s)", (INGESTION_LOCK_NAMESPACE, document_id))
+    finally:
+        conn.close()
+
+def create_ingestion_document(
+    document_name: str,
+    file_type: str,
+    blob_url: str,
+    text_blob_name: str,
+    index_table: str,
+    chunks: list,
+    created_at: Optional[datetime] = None
+) -> int:
+    """
+    Records a document and all of its extracted chunks in a single transaction.
+    Args:
+        document_name (str): Name of the document
+        file_type (str): MIME type of the document
+        blob_url (str): URL of the original file in blob storage
+        text_blob_name (str): Name of the extracted text artifact
+        index_table (str): Embeddings table the chunks are stored in
+        chunks (list): DocumentChunk objects produced by chunking the extracted text
+        created_at (datetime): Original upload time, for documents recorded after the fact
+    Returns:
+        int: ID of the new ingestion document
+    """
+    try:
+        with connect_to_db() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    """
+                    INSERT INTO ingestion_documents
+                        (document_name, file_type, blob_url, text_blob_name, index_table, status, created_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, COALESCE(%s::timestamptz, NOW()))
+                    RETURNING id
+                    """,
+                    (document_name, file_type, blob_url, text_blob_name, index_table, DOCUMENT_PROCESSING, created_at)
+                )
+                document_id = cur.fetchone()[0]
+
+                execute_values(
+                    cur,
+                    """
+                    INSERT INTO ingestion_chunks
+                        (document_id, chunk_idx, content, start_idx, end_idx, chunk_size, status)
+                    VALUES %s
+                    """,
+                    [
+                        (
+                            document_id,
+                            chunk_idx,
+                            chunk.content,
+                            chunk.start_idx,
+                            chunk.end_idx,
+                            chunk.metadata.get("chunk_size", 0),
+                            CHUNK_EXTRACTED
+                        )
+                        for chunk_idx, chunk in enumerate(chunks)
+                    ]
+                )
+                conn.commit()
+
+        logging.info(f"Recorded {len(chunks)} chunks for {document_name} (document id {document_id})")
+        return document_id
+
+    except Exception as e:
+        logging.error(f"Error in create_ingestion_document: {str(e)}")
+        raise
+
+DOCUMENT_COLUMNS = "id, document_name, file_type, blob_url, text_blob_name, index_table, status, created_at"
+
+def document_from_row(row) -> dict:
+    """Maps a row selected with DOCUMENT_COLUMNS to an ingestion record."""
+    return {
+        "id": row[0],
+        "document_name": row[1],
+        "file_type": row[2],
+        "blob_url": row[3],
+        "text_blob_name": row[4],
+        "index_table": row[5],
+        "status": row[6],
+        "created_at": row[7]
+    }
+
+def get_ingestion_document(document_id: int) -> Optional[dict]:
+    """Returns the ingestion record for a document, or None if it does not exist."""
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT {DOCUMENT_COLUMNS} FROM ingestion_documents WHERE id = %s",
+                (document_id,)
+            )
+            row = cur.fetchone()
+
+    return document_from_row(row) if row else None
+
+def get_latest_document(document_name: str) -> Optional[dict]:
+    """Returns the most recent ingestion record for a document name, or None if there is none."""
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                SELECT {DOCUMENT_COLUMNS}
+                FROM ingestion_documents
+                WHERE document_name = %s
+                ORDER BY created_at DESC, id DESC
+                LIMIT 1
+                """,
+                (document_name,)
+            )
+            row = cur.fetchone()
+
+    return document_from_row(row) if row else None
+
+def list_latest_documents() -> List[dict]:
+    """Returns the most recent ingestion record for every document name."""
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT DISTINCT ON (document_name)
+                    id, document_name, file_type, blob_url, text_blob_name, index_table, created_at
+                FROM ingestion_documents
+                ORDER BY document_name, created_at DESC, id DESC
+                """
+            )
+            rows = cur.fetchall()
+
+    return [
+        {
+            "id": document_id,
+            "document_name": document_name,
+            "file_type": file_type,
+            "blob_url": blob_url,
+            "text_blob_name": text_blob_name,
+            "index_table": index_table,
+            "created_at": created_at
+        }
+        for document_id, document_name, file_type, blob_url, text_blob_name, index_table, created_at in rows
+    ]
+
+def set_text_blob_name(document_id: int, text_blob_name: str):
+    """Records the extracted text artifact for a document ingested before artifacts were kept."""
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE ingestion_documents
+                SET text_blob_name = %s, updated_at = NOW()
+                WHERE id = %s
+                """,
+                (text_blob_name, document_id)
+            )
+            conn.commit()
+
+def get_unfinished_chunks(document_id: int) -> List[dict]:
+    """Returns every chunk of a document that has not been stored yet, in chunk order."""
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT chunk_idx, content, start_idx, end_idx, chunk_size, status
+                FROM ingestion_chunks
+                WHERE document_id = %s AND status <> %s
+                ORDER BY chunk_idx
+                """,
+                (document_id, CHUNK_STORED)
+            )
+            rows = cur.fetchall()
+
+    return [
+        {
+            "chunk_idx": chunk_idx,
+            "content": content,
+            "start_idx": start_idx,
+            "end_idx": end_idx,
+            "chunk_size": chunk_size,
+            "status": status
+        }
+        for chunk_idx, content, start_idx, end_idx, chunk_size, status in rows
+    ]
+
+def save_chunk_embedding(document_id: int, chunk_idx: int, embedding: list) -> bool:
+    """
+    Checkpoints a computed embedding so it is never requested from OpenAI again.
+    Returns False if the chunk had already moved past extraction, in which case nothing changes.
+    """
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE ingestion_chunks
+                SET embedding = %s::vector, status = %s, error = NULL, updated_at = NOW()
+                WHERE document_id = %s AND chunk_idx = %s AND status = %s
+                """,
+                (embedding, CHUNK_EMBEDDED, document_id, chunk_idx, CHUNK_EXTRACTED)
+            )
+            saved = cur.rowcount == 1
+            conn.commit()
+
+    return saved
+
+def store_chunk(document_id: int, chunk_idx: int, document_name: str, metadata: dict, table_name: str):
+    """
+    Copies an embedded chunk into the embeddings table and marks it stored.
+    Both writes happen in one transaction, so a chunk is never searchable twice
+    and never marked stored without being searchable.
+    """
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            # Claim the chunk first; the row lock makes a concurrent retry of the
+            # same chunk wait here and then match nothing
+            cur.execute(
+                """
+                UPDATE ingestion_chunks
+                SET status = %s, error = NULL, updated_at = NOW()
+                WHERE document_id = %s AND chunk_idx = %s AND status = %s
+                """,
+                (CHUNK_STORED, document_id, chunk_idx, CHUNK_EMBEDDED)
+            )
+            if cur.rowcount != 1:
+                raise ValueError(f"Chunk {chunk_idx} of document {document_id} is not ready to be stored")
+
+            # Chunks keep the document's upload time, however late a retry stores them
+            cur.execute(
+                sql.SQL("""
+                INSERT INTO {table} (document_name, file_type, uploaded_at, embedding, metadata)
+                SELECT %s, %s, d.created_at, c.embedding, %s
+                FROM ingestion_chunks c
+                JOIN ingestion_documents d ON d.id = c.document_id
+                WHERE c.document_id = %s AND c.chunk_idx = %s
+                """).format(table=sql.Identifier(table_name)),
+                (
+                    str(document_name),
+                    metadata.get("file_type"),
+                    Json(metadata),
+                    document_id,
+                    chunk_idx
+                )
+            )
+            conn.commit()
+
+def mark_chunk_failed(document_id: int, chunk_idx: int, error: str):
+    """Records why a chunk failed; its status is left at the last completed stage."""
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE ingestion_chunks
+                SET error = %s, updated_at = NOW()
+                WHERE document_id = %s AND chunk_idx = %s
+                """,
+                (error, document_id, chunk_idx)
+            )
+            conn.commit()
+
+def refresh_document_status(document_id: int) -> str:
+    """Sets the document status from its chunks and returns it."""
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE ingestion_documents
+                SET status = CASE
+                        WHEN EXISTS (
+                            SELECT 1 FROM ingestion_chunks
+                            WHERE document_id = %s AND status <> %s
+                        ) THEN %s
+                        ELSE %s
+                    END,
+                    updated_at = NOW()
+                WHERE id = %s
+                RETURNING status
+                """,
+                (document_id, CHUNK_STORED, DOCUMENT_PARTIAL, DOCUMENT_COMPLETED, document_id)
+            )
+            status = cur.fetchone()[0]
+            conn.commit()
+
+    return status
+
+def mark_document_completed(document_id: int):
+    """Marks a document completed whose unfinished chunks are no longer needed, e.g. after a re-index."""
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE ingestion_documents
+                SET status = %s, updated_at = NOW()
+                WHERE id = %s
+                """,
+                (DOCUMENT_COMPLETED, document_id)
+            )
+            conn.commit()
@@ -0,0 +1,268 @@
+# services/openai_scheduler.py
+import heapq
+import itertools
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Optional
+
+import openai
+
+# Request priorities; lower values are served first
+INTERACTIVE = 0
+BULK = 1
+
+
+class TokenBucket:
+    """Token bucket refilled continuously up to a per-minute capacity."""
+
+    def __init__(self, capacity_per_minute: float):
+        self.capacity = float(capacity_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until_available(self, amount: float, now: float) -> float:
+        """Seconds to wait before `amount` tokens can be taken (0 if available now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float):
+        self.tokens -= min(amount, self.capacity)
+
+    def drain(self):
+        """Empty the bucket after the server reports that we are over the limit."""
+        self.tokens = 0.0
+
+
+class LatencyTracker:
+    """
+    Latency of one kind of call (embeddings, chat, ...), compared against the
+    fastest call in a recent window so the baseline follows real shifts in latency.
+    """
+
+    def __init__(self, window: int = 50):
+        self.samples = deque(maxlen=window)
+        self.smoothed: Optional[float] = None
+
+    def observe(self, latency: float):
+        self.samples.append(latency)
+        if self.smoothed is None:
+            self.smoothed = latency
+        else:
+            self.smoothed = 0.8 * self.smoothed + 0.2 * latency
+
+    def is_congested(self, tolerance: float) -> bool:
+        return self.smoothed > min(self.samples) * tolerance
+
+
+class OpenAIScheduler:
+    """
+    Client-side scheduler shared by every OpenAI call in the process.
+
+    Each call waits for a concurrency slot and for capacity in the request and
+    token buckets. Waiting calls are served by priority, so interactive queries
+    go ahead of bulk ingestion. Concurrency grows while each kind of call stays
+    close to its recent best latency, and is cut back when latency climbs or the
+    API answers with 429. Rate-limited and transient failures are retried with
+    jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 3000,
+        tokens_per_minute: float = 1_000_000,
+        initial_concurrency: int = 4,
+        min_concurrency: int = 1,
+        max_concurrency: int = 32,
+        max_retries: int = 6,
+        base_backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        latency_tolerance: float = 2.0
+    ):
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.concurrency_limit = float(initial_concurrency)
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.latency_tolerance = latency_tolerance
+
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.latency_trackers = {}
+        # Calls still in flight when the limit was last cut were sent at the old
+        # limit; another cut waits until they have all completed
+        self.completions_since_decrease = 0
+        self.in_flight_at_decrease = 0
+
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+
+    def acquire(self, priority: int = BULK, tokens: int = 1):
+        """Block until a slot and bucket capacity are available for this call."""
+        ticket = (priority, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    timeout = None
+                    if self._waiting[0] == ticket and self.in_flight < int(self.concurrency_limit):
+                        now = time.monotonic()
+                        timeout = max(
+                            self.paused_until - now,
+                            self.request_bucket.time_until_available(1, now),
+                            self.token_bucket.time_until_available(tokens, now)
+                        )
+                        if timeout <= 0:
+                            self.request_bucket.consume(1)
+                            self.token_bucket.consume(tokens)
+                            self.in_flight += 1
+                            return
+                    self._condition.wait(timeout)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._condition.notify_all()
+
+    def release(
+        self,
+        kind: str = "default",
+        latency: Optional[float] = None,
+        rate_limited: bool = False,
+        retry_after: Optional[float] = None
+    ):
+        """Free a slot and adapt the concurrency limit to what the call observed."""
+        with self._condition:
+            self.in_flight -= 1
+            self.completions_since_decrease += 1
+
+            if rate_limited:
+                # Multiplicative decrease once per window, and hold everyone back until the server recovers
+                if self.can_decrease():
+                    self.decrease(0.5)
+                self.request_bucket.drain()
+                if retry_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                logging.warning(f"OpenAI rate limit hit; concurrency limit now {self.concurrency_limit:.1f}")
+            elif latency is not None:
+                tracker = self.latency_trackers.setdefault(kind, LatencyTracker())
+                tracker.observe(latency)
+
+                if tracker.is_congested(self.latency_tolerance):
+                    # Cut at most once per window of calls, so a single slow call
+                    # lingering in the average does not compound into a deep cut
+                    if self.can_decrease() and self.completions_since_decrease >= self.concurrency_limit:
+                        self.decrease(0.9)
+                else:
+                    # Additive increase of roughly one slot per window of calls
+                    self.concurrency_limit = min(
+                        self.max_concurrency,
+                        self.concurrency_limit + 1 / self.concurrency_limit
+                    )
+
+            self._condition.notify_all()
+
+    def can_decrease(self) -> bool:
+        """Whether every call in flight at the last cut has completed; the caller holds the condition."""
+        return self.completions_since_decrease > self.in_flight_at_decrease
+
+    def decrease(self, factor: float):
+        """Cut the concurrency limit and start a new window; the caller holds the condition."""
+        self.concurrency_limit = max(self.min_concurrency, self.concurrency_limit * factor)
+        self.completions_since_decrease = 0
+        self.in_flight_at_decrease = self.in_flight
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+        delay = random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+        if retry_after:
+            delay = max(delay, retry_after)
+        return delay
+
+    def run(self, fn: Callable[[], Any], priority: int = BULK, tokens: int = 1, kind: str = "default") -> Any:
+        """
+        Run an OpenAI call under the scheduler.
+        Args:
+            fn (callable): Zero-argument function performing the API call
+            priority (int): INTERACTIVE or BULK
+            tokens (int): Estimated tokens consumed by the call
+            kind (str): Kind of call, e.g. "embeddings", "query_embeddings" or "chat"; latency is judged per kind
+        Returns:
+            The return value of fn
+        """
+        attempt = 0
+        while True:
+            self.acquire(priority=priority, tokens=tokens)
+            started = time.monotonic()
+            try:
+                result = fn()
+            except Exception as e:
+                rate_limited = is_rate_limit_error(e)
+                retry_after = get_retry_after(e)
+                self.release(kind=kind, rate_limited=rate_limited, retry_after=retry_after)
+
+                if not (rate_limited or is_transient_error(e)) or attempt >= self.max_retries:
+                    raise
+
+                delay = self.backoff_delay(attempt, retry_after)
+                logging.info(f"Retrying OpenAI call in {delay:.2f}s (attempt {attempt + 1}): {str(e)}")
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self.release(kind=kind, latency=time.monotonic() - started)
+            return result
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return isinstance(error, openai.RateLimitError) or getattr(error, "status_code", None) == 429
+
+
+def is_transient_error(error: Exception) -> bool:
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    return status_code is not None and status_code >= 500
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Read the Retry-After header from an API error, if the server sent one."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+_scheduler: Optional[OpenAIScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_openai_scheduler() -> OpenAIScheduler:
+    """Return the process-wide scheduler, configured from environment variables."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = OpenAIScheduler(
+                requests_per_minute=float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "3000")),
+                tokens_per_minute=float(os.getenv("OPENAI_TOKENS_PER_MINUTE", "1000000")),
+                max_concurrency=int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+            )
+        return _scheduler
@@ -0,0 +1,244 @@
+# services/schema_service.py
+import logging
+import threading
+from app.services.vector_service import (
+    DEFAULT_EMBEDDINGS_TABLE,
+    DEFAULT_EMBEDDING_MODEL,
+    DEFAULT_EMBEDDING_DIMENSIONS,
+    DEFAULT_CHUNK_SIZE,
+    connect_to_db,
+    create_embeddings_table,
+    create_embeddings_indexes
+)
+
+# Advisory lock key serialising migrations started at the same time
+SCHEMA_LOCK_KEY = 7262001
+
+# Rows backfilled per transaction, so the backfill never holds locks on the whole table
+BACKFILL_BATCH_SIZE = 5000
+
+# Columns the application reads; a database missing any of them has not been migrated
+REQUIRED_COLUMNS = {
+    DEFAULT_EMBEDDINGS_TABLE: ("file_type", "uploaded_at"),
+    "embedding_indexes": ("table_name", "is_active"),
+    "ingestion_documents": ("text_blob_name", "index_table"),
+    "ingestion_chunks": ("status", "embedding")
+}
+
+_schema_verified = False
+_schema_lock = threading.Lock()
+
+class SchemaOutdatedError(Exception):
+    """Raised when the database has not been migrated to the schema this code expects."""
+
+def missing_columns(cur, table_name: str, columns) -> list:
+    """Returns the columns of a table that do not exist yet, read from the catalog without locking the table."""
+    cur.execute(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        """,
+        (table_name,)
+    )
+    existing = {row[0] for row in cur.fetchall()}
+    return [column for column in columns if column not in existing]
+
+def migrate_schema(cur):
+    """
+    Creates missing tables and columns without touching existing data; the caller commits.
+    Only statements that are quick on a populated database run here. Columns are added
+    only when the catalog shows them missing, so a database that is already up to date is
+    never locked. Indexes on existing tables are left to build_indexes.
+    """
+    cur.execute("SELECT pg_advisory_xact_lock(%s)", (SCHEMA_LOCK_KEY,))
+
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL", (DEFAULT_EMBEDDINGS_TABLE,))
+    if cur.fetchone()[0]:
+        # Tables created before the filter columns existed: file_type is recovered from
+        # the metadata by backfill_file_types, uploaded_at falls back to the time of the migration
+        missing = missing_columns(cur, DEFAULT_EMBEDDINGS_TABLE, ("file_type", "uploaded_at"))
+        if "file_type" in missing:
+            cur.execute("ALTER TABLE document_embeddings ADD COLUMN file_type TEXT;")
+        if "uploaded_at" in missing:
+            cur.execute("ALTER TABLE document_embeddings ADD COLUMN uploaded_at TIMESTAMPTZ NOT NULL DEFAULT NOW();")
+    else:
+        create_embeddings_table(cur, DEFAULT_EMBEDDINGS_TABLE, DEFAULT_EMBEDDING_DIMENSIONS)
+
+    # Registry of embedding tables; exactly one is active at a time and searches
+    # and uploads follow it, so re-indexing can switch atomically. Existing
+    # databases start out with their current table registered as active.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS embedding_indexes (
+            table_name TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            dimensions INTEGER NOT NULL,
+            chunk_size INTEGER NOT NULL,
+            is_active BOOLEAN NOT NULL DEFAULT FALSE,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_single_active_index
+        ON embedding_indexes(is_active) WHERE is_active;
+    """)
+    cur.execute(
+        """
+        INSERT INTO embedding_indexes (table_name, model, dimensions, chunk_size, is_active)
+        SELECT %s, %s, %s, %s, TRUE
+        WHERE NOT EXISTS (SELECT 1 FROM embedding_indexes WHERE is_active)
+        ON CONFLICT (table_name) DO NOTHING
+        """,
+        (DEFAULT_EMBEDDINGS_TABLE, DEFAULT_EMBEDDING_MODEL, DEFAULT_EMBEDDING_DIMENSIONS, DEFAULT_CHUNK_SIZE)
+    )
+
+    # Ingestion checkpoints: one row per uploaded document and one per
+    # chunk, recording how far each chunk got so failures can be resumed
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingestion_documents (
+            id SERIAL PRIMARY KEY,
+            document_name TEXT NOT NULL,
+            file_type TEXT,
+            blob_url TEXT,
+            text_blob_name TEXT,
+            index_table TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS ingestion_chunks (
+            document_id INTEGER NOT NULL REFERENCES ingestion_documents(id) ON DELETE CASCADE,
+            chunk_idx INTEGER NOT NULL,
+            content TEXT NOT NULL,
+            start_idx INTEGER,
+            end_idx INTEGER,
+            chunk_size INTEGER,
+            status TEXT NOT NULL,
+            error TEXT,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+            embedding VECTOR,
+            PRIMARY KEY (document_id, chunk_idx)
+        );
+    """)
+
+    # Ingestion records from before extracted text was kept, all stored in the default table
+    missing = missing_columns(cur, "ingestion_documents", ("text_blob_name", "index_table"))
+    if "text_blob_name" in missing:
+        cur.execute("ALTER TABLE ingestion_documents ADD COLUMN text_blob_name TEXT;")
+    if "index_table" in missing:
+        cur.execute(
+            "ALTER TABLE ingestion_documents ADD COLUMN index_table TEXT NOT NULL DEFAULT %s;",
+            (DEFAULT_EMBEDDINGS_TABLE,)
+        )
+
+def backfill_file_types(conn, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Copies file_type out of the metadata of older rows in small committed batches. Returns the rows updated."""
+    updated = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE document_embeddings
+                SET file_type = metadata->>'file_type'
+                WHERE id IN (
+                    SELECT id FROM document_embeddings
+                    WHERE file_type IS NULL AND metadata ? 'file_type'
+                    LIMIT %s
+                )
+                """,
+                (batch_size,)
+            )
+            count = cur.rowcount
+        conn.commit()
+        updated += count
+        if count < batch_size:
+            return updated
+
+def build_indexes(conn):
+    """
+    Builds the search filter indexes on the default embeddings table without blocking
+    writes. Indexes left invalid by an interrupted build are dropped and rebuilt.
+    """
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT index_class.relname
+                FROM pg_index
+                JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+                WHERE pg_index.indrelid = to_regclass(%s) AND NOT pg_index.indisvalid
+                """,
+                (DEFAULT_EMBEDDINGS_TABLE,)
+            )
+            for (index_name,) in cur.fetchall():
+                logging.info(f"Dropping invalid index {index_name}")
+                cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{index_name}"')
+
+            create_embeddings_indexes(cur, DEFAULT_EMBEDDINGS_TABLE, concurrently=True)
+            # Superseded by idx_document_embeddings_document_name
+            cur.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_document_name")
+    finally:
+        conn.autocommit = False
+
+def run_migration():
+    """
+    Brings a database from any earlier version up to date without clearing it.
+    Run once per deployment, before the new code serves requests:
+        python -m app.services.schema_service
+    """
+    conn = connect_to_db()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (SCHEMA_LOCK_KEY,))
+        try:
+            with conn.cursor() as cur:
+                migrate_schema(cur)
+            conn.commit()
+            logging.info("Tables and columns are up to date")
+
+            updated = backfill_file_types(conn)
+            logging.info(f"Backfilled file_type on {updated} embeddings")
+
+            build_indexes(conn)
+            logging.info("Search filter indexes are built")
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (SCHEMA_LOCK_KEY,))
+            conn.commit()
+    finally:
+        conn.close()
+
+def verify_schema():
+    """
+    Checks once per process that the database has been migrated, reading only the
+    catalog so requests never wait on table locks. Raises SchemaOutdatedError if not.
+    """
+    global _schema_verified
+    if _schema_verified:
+        return
+
+    with _schema_lock:
+        if _schema_verified:
+            return
+        with connect_to_db() as conn:
+            with conn.cursor() as cur:
+                missing = [
+                    f"{table_name}.{column}"
+                    for table_name, columns in REQUIRED_COLUMNS.items()
+                    for column in missing_columns(cur, table_name, columns)
+                ]
+        if missing:
+            raise SchemaOutdatedError(
+                f"Database schema is out of date (missing {', '.join(missing)}); "
+                "run python -m app.services.schema_service"
+            )
+        _schema_verified = True
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    try:
+        run_migration()
+        print("Database schema is up to date")
+    except Exception as e:
+        print(f"Error migrating schema: {str(e)}")
+        raise SystemExit(1)
@@ -1,12 +1,34 @@
 import os
 from dotenv import load_dotenv
 from psycopg2 import connect, sql
-from psycopg2.extras import Json
+from psycopg2.extras import Json, execute_values
 import logging
+from datetime import datetime
+from typing import List, Optional
 
 # Load environment variables from .env file
 load_dotenv()
 
+# The index created by ClearData; re-index jobs register additional tables
+DEFAULT_EMBEDDINGS_TABLE = "document_embeddings"
+DEFAULT_EMBEDDING_MODEL = "text-embedding-3-small"
+DEFAULT_EMBEDDING_DIMENSIONS = 1536
+DEFAULT_CHUNK_SIZE = 900
+
+# Native output size of each embedding model; smaller sizes are requested explicitly
+MODEL_DIMENSIONS = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536
+}
+
+DEFAULT_INDEX = {
+    "table_name": DEFAULT_EMBEDDINGS_TABLE,
+    "model": DEFAULT_EMBEDDING_MODEL,
+    "dimensions": DEFAULT_EMBEDDING_DIMENSIONS,
+    "chunk_size": DEFAULT_CHUNK_SIZE
+}
+
 def connect_to_db():
     """
     Establishes connection to PostgreSQL database using environment variables.
@@ -20,54 +42,296 @@ def connect_to_db():
         port=os.getenv('PGPORT')
     )
 
-def insert_embedding(document_name: str, embedding: list, metadata: dict):
+def requested_dimensions(model: str, dimensions: Optional[int]) -> Optional[int]:
+    """The `dimensions` to send to the embeddings API, or None when the model's native size is wanted."""
+    if dimensions and dimensions != MODEL_DIMENSIONS.get(model):
+        return dimensions
+    return None
+
+def create_embeddings_table(cur, table_name: str, dimensions: int):
+    """
+    Creates an embeddings table and the indexes backing the search filters, if missing.
+    Args:
+        cur: Open database cursor; the caller commits
+        table_name (str): Name of the table to create
+        dimensions (int): Dimensions of the embedding vectors
+    """
+    table = sql.Identifier(table_name)
+
+    # Embeddings are the last column
+    cur.execute(
+        sql.SQL("""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id SERIAL PRIMARY KEY,
+                document_name TEXT,
+                file_type TEXT,
+                uploaded_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+                metadata JSONB,
+                embedding VECTOR({dimensions})
+            );
+        """).format(table=table, dimensions=sql.Literal(int(dimensions)))
+    )
+
+    create_embeddings_indexes(cur, table_name)
+
+def create_embeddings_indexes(cur, table_name: str, concurrently: bool = False):
+    """
+    Creates the indexes backing the search filters on an embeddings table, if missing.
+    Building them concurrently keeps the table writable, but the cursor's connection
+    must then be in autocommit mode.
+    """
+    table = sql.Identifier(table_name)
+    create = sql.SQL("CREATE INDEX CONCURRENTLY IF NOT EXISTS" if concurrently else "CREATE INDEX IF NOT EXISTS")
+
+    # Promoted columns for the common filters, GIN for containment queries on other metadata
+    for suffix, definition in (
+        ("document_name", "(document_name)"),
+        ("file_type", "(file_type)"),
+        ("uploaded_at", "(uploaded_at)"),
+        ("metadata", "USING GIN (metadata jsonb_path_ops)")
+    ):
+        cur.execute(
+            sql.SQL("{create} {index} ON {table} {definition}").format(
+                create=create,
+                index=sql.Identifier(f"idx_{table_name}_{suffix}"),
+                table=table,
+                definition=sql.SQL(definition)
+            )
+        )
+
+def fetch_active_index(cur) -> dict:
+    """Reads the embedding index that searches and uploads currently use."""
+    cur.execute(
+        """
+        SELECT table_name, model, dimensions, chunk_size
+        FROM embedding_indexes
+        WHERE is_active
+        """
+    )
+    row = cur.fetchone()
+    if not row:
+        # Databases from before the registry existed only have the default table
+        return dict(DEFAULT_INDEX)
+
+    table_name, model, dimensions, chunk_size = row
+    return {"table_name": table_name, "model": model, "dimensions": dimensions, "chunk_size": chunk_size}
+
+def get_active_index() -> dict:
+    """
+    Returns the active embedding index.
+    Returns:
+        dict: table_name, model, dimensions and chunk_size of the active index
+    """
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            return fetch_active_index(cur)
+
+def get_embedding_index(table_name: str) -> Optional[dict]:
+    """Returns a registered embedding index by table name, or None if it does not exist."""
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT table_name, model, dimensions, chunk_size, is_active
+                FROM embedding_indexes
+                WHERE table_name = %s
+                """,
+                (table_name,)
+            )
+            row = cur.fetchone()
+
+    if not row:
+        return None
+
+    table_name, model, dimensions, chunk_size, is_active = row
+    return {
+        "table_name": table_name,
+        "model": model,
+        "dimensions": dimensions,
+        "chunk_size": chunk_size,
+        "is_active": is_active
+    }
+
+def register_embedding_index(table_name: str, model: str, dimensions: int, chunk_size: int):
+    """Creates a new, inactive embeddings table and records how it is built."""
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            create_embeddings_table(cur, table_name, dimensions)
+            cur.execute(
+                """
+                INSERT INTO embedding_indexes (table_name, model, dimensions, chunk_size, is_active)
+                VALUES (%s, %s, %s, %s, FALSE)
+                """,
+                (table_name, model, dimensions, chunk_size)
+            )
+            conn.commit()
+
+def activate_embedding_index(table_name: str):
+    """
+    Switches searches and uploads over to another embedding index.
+    Both updates run in one transaction, so every search sees exactly one active index.
+    """
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE embedding_indexes SET is_active = FALSE WHERE is_active")
+            cur.execute(
+                "UPDATE embedding_indexes SET is_active = TRUE WHERE table_name = %s",
+                (table_name,)
+            )
+            if cur.rowcount != 1:
+                conn.rollback()
+                raise ValueError(f"Embedding index {table_name} is not registered")
+            conn.commit()
+
+    logging.info(f"Embedding index {table_name} is now active")
+
+def replace_document_embeddings(table_name: str, document_name: str, rows: List[tuple], uploaded_at: datetime):
     """
-    Inserts document embedding and metadata into the database.
+    Replaces every chunk of a document in an embeddings table in one transaction.
     Args:
+        table_name (str): Embeddings table to write to
         document_name (str): Name of the document
-        embedding (list): Vector embedding of the document
-        metadata (dict): Additional metadata about the document
+        rows (list): (embedding, metadata) tuples, one per chunk
+        uploaded_at (datetime): Original upload time, kept so date filters still apply
     """
-    try:
-        # Log the incoming data types
-        logging.info(f"Inserting embedding for {document_name}")
-        logging.info(f"Metadata type: {type(metadata)}")
-        logging.info(f"Embedding type: {type(embedding)}")
+    table = sql.Identifier(table_name)
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            # Serialise replacements of the same document, so two writers racing
+            # (re-index job and a finishing upload) cannot both insert a copy
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"{table_name}:{document_name}",))
+            cur.execute(
+                sql.SQL("DELETE FROM {table} WHERE document_name = %s").format(table=table),
+                (document_name,)
+            )
+            execute_values(
+                cur,
+                sql.SQL("""
+                    INSERT INTO {table} (document_name, file_type, uploaded_at, embedding, metadata)
+                    VALUES %s
+                """).format(table=table).as_string(cur),
+                [
+                    (document_name, metadata.get("file_type"), uploaded_at, embedding, Json(metadata))
+                    for embedding, metadata in rows
+                ],
+                template="(%s, %s, %s, %s::vector, %s)"
+            )
+            conn.commit()
 
-        with connect_to_db() as conn:
-            with conn.cursor() as cur:
-                # Convert metadata to JSON using psycopg2's Json adapter
-                json_metadata = Json(metadata)
+def list_indexed_documents(table_name: str) -> List[dict]:
+    """Returns one entry per document stored in an embeddings table, with its earliest upload time."""
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("""
+                    SELECT document_name, MIN(file_type), MIN(metadata->>'blob_url'), MIN(uploaded_at)
+                    FROM {table}
+                    GROUP BY document_name
+                """).format(table=sql.Identifier(table_name))
+            )
+            rows = cur.fetchall()
 
-                # Cast the embedding list to a vector
-                cur.execute(
-                    """
-                    INSERT INTO document_embeddings (document_name, embedding, metadata)
-                    VALUES (%s, %s::vector, %s)
-                    """,
-                    (str(document_name), embedding, json_metadata)
-                )
-                conn.commit()
+    return [
+        {"document_name": document_name, "file_type": file_type, "blob_url": blob_url, "uploaded_at": uploaded_at}
+        for document_name, file_type, blob_url, uploaded_at in rows
+    ]
 
-    except Exception as e:
-        logging.error(f"Error in insert_embedding: {str(e)}")
-        logging.error(f"Failed metadata: {metadata}")
-        raise
+def document_is_indexed(table_name: str, document_name: str) -> bool:
+    """Returns whether an embeddings table holds any chunks of a document."""
+    with connect_to_db() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL("SELECT EXISTS (SELECT 1 FROM {table} WHERE document_name = %s)").format(
+                    table=sql.Identifier(table_name)
+                ),
+                (document_name,)
+            )
+            return cur.fetchone()[0]
 
-def search_embeddings(query_embedding: list, top_k: int = 5):
+def build_search_filter(
+    document_names: Optional[List[str]] = None,
+    file_types: Optional[List[str]] = None,
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None,
+    metadata_filter: Optional[dict] = None
+):
+    """
+    Builds the WHERE clause used to restrict a similarity search.
+    Args:
+        document_names (list): Only match chunks from these documents
+        file_types (list): Only match chunks with these MIME types
+        uploaded_after (datetime): Only match chunks uploaded at or after this time
+        uploaded_before (datetime): Only match chunks uploaded before this time
+        metadata_filter (dict): Only match chunks whose metadata contains these key/value pairs
+    Returns:
+        tuple: (sql.Composable clause, list of parameters); the clause is empty when no filter is set
+    """
+    conditions = []
+    params = []
+
+    if document_names:
+        conditions.append(sql.SQL("document_name = ANY(%s)"))
+        params.append(list(document_names))
+    if file_types:
+        conditions.append(sql.SQL("file_type = ANY(%s)"))
+        params.append(list(file_types))
+    if uploaded_after:
+        conditions.append(sql.SQL("uploaded_at >= %s"))
+        params.append(uploaded_after)
+    if uploaded_before:
+        conditions.append(sql.SQL("uploaded_at < %s"))
+        params.append(uploaded_before)
+    if metadata_filter:
+        conditions.append(sql.SQL("metadata @> %s"))
+        params.append(Json(metadata_filter))
+
+    if not conditions:
+        return sql.SQL(""), params
+
+    return sql.SQL("WHERE ") + sql.SQL(" AND ").join(conditions), params
+
+def search_embeddings(
+    query_embedding: list,
+    top_k: int = 5,
+    document_names: Optional[List[str]] = None,
+    file_types: Optional[List[str]] = None,
+    uploaded_after: Optional[datetime] = None,
+    uploaded_before: Optional[datetime] = None,
+    metadata_filter: Optional[dict] = None,
+    index: Optional[dict] = None
+):
     """
     Searches for similar embeddings in the database and prints relevant document names with distances.
+    Filters are applied in the same query as the nearest-neighbour ordering, so the top_k results
+    are always drawn from the matching chunks only.
     Args:
         query_embedding (list): Vector embedding to search against
         top_k (int): Number of results to return
+        document_names (list): Optional list of document names to restrict the search to
+        file_types (list): Optional list of MIME types to restrict the search to
+        uploaded_after (datetime): Optional lower bound on the upload time
+        uploaded_before (datetime): Optional upper bound on the upload time
+        metadata_filter (dict): Optional key/value pairs the chunk metadata must contain
+        index (dict): Embedding index the query embedding was built for; defaults to the active index
     Returns:
         list: List of tuples containing (document_name, metadata, embedding)
     """
     try:
+        where_clause, filter_params = build_search_filter(
+            document_names=document_names,
+            file_types=file_types,
+            uploaded_after=uploaded_after,
+            uploaded_before=uploaded_before,
+            metadata_filter=metadata_filter
+        )
+
         with connect_to_db() as conn:
             with conn.cursor() as cur:
-                logging.info(f"Searching for top {top_k} similar embeddings")
-                cur.execute(
+                if index is None:
+                    index = fetch_active_index(cur)
+
+                logging.info(f"Searching for top {top_k} similar embeddings in {index['table_name']}")
+                query = sql.SQL(
                     """
                     SELECT
                         id,
@@ -75,12 +339,13 @@ def search_embeddings(query_embedding: list, top_k: int = 5):
                         metadata,
                         embedding,
                         embedding <-> %s::vector as distance
-                    FROM document_embeddings
+                    FROM {table}
+                    {where}
                     ORDER BY embedding <-> %s::vector
                     LIMIT %s
-                    """,
-                    (query_embedding, query_embedding, top_k)
-                )
+                    """
+                ).format(table=sql.Identifier(index["table_name"]), where=where_clause)
+                cur.execute(query, (query_embedding, *filter_params, query_embedding, top_k))
                 results = cur.fetchall()
 
                 # Log and print the relevant document names with distances
@@ -5,6 +5,8 @@ from azure.storage.blob import BlobServiceClient
 import psycopg2
 from psycopg2 import sql
 import logging
+from app.services.blob_service import EXTRACTED_TEXT_CONTAINER
+from app.services.schema_service import migrate_schema
 
 # Load environment variables
 load_dotenv()
@@ -31,42 +33,44 @@ def cleanup_storage_and_db():
         container_name = "documents"  # Replace with your container name if different
 
         try:
-            container_client = blob_service_client.get_container_client(container_name)
-            blobs = container_client.list_blobs()
-            for blob in blobs:
-                logging.info(f"Deleting blob: {blob.name}")
-                container_client.delete_blob(blob.name)
+            for name in (container_name, EXTRACTED_TEXT_CONTAINER):
+                container_client = blob_service_client.get_container_client(name)
+                if name != container_name and not container_client.exists():
+                    continue
+                blobs = container_client.list_blobs()
+                for blob in blobs:
+                    logging.info(f"Deleting blob: {blob.name}")
+                    container_client.delete_blob(blob.name)
             logging.info("All blobs deleted successfully")
         except Exception as e:
             logging.error(f"Error clearing blob storage: {str(e)}")
             raise
 
-        # 2. Recreate Database Table
+        # 2. Recreate Database Tables
         with connect_to_db() as conn:
             with conn.cursor() as cur:
-                # Drop existing table if it exists
-                cur.execute("""
-                    DROP TABLE IF EXISTS document_embeddings;
-                """)
+                # Drop every embeddings table a re-index job has registered
+                cur.execute("SELECT to_regclass('embedding_indexes') IS NOT NULL")
+                if cur.fetchone()[0]:
+                    cur.execute("SELECT table_name FROM embedding_indexes")
+                    for (table_name,) in cur.fetchall():
+                        cur.execute(
+                            sql.SQL("DROP TABLE IF EXISTS {table}").format(table=sql.Identifier(table_name))
+                        )
 
-                # Recreate table with embeddings as the last column
+                # Drop existing tables if they exist
                 cur.execute("""
-                    CREATE TABLE document_embeddings (
-                        id SERIAL PRIMARY KEY,
-                        document_name TEXT,
-                        metadata JSONB,
-                        embedding VECTOR(1536)
-                    );
+                    DROP TABLE IF EXISTS ingestion_chunks;
+                    DROP TABLE IF EXISTS ingestion_documents;
+                    DROP TABLE IF EXISTS embedding_indexes;
+                    DROP TABLE IF EXISTS document_embeddings;
                 """)
 
-                # Create an index on document_name if needed
-                cur.execute("""
-                    CREATE INDEX IF NOT EXISTS idx_document_name
-                    ON document_embeddings(document_name);
-                """)
+                # Recreate the embeddings, registry and ingestion tables through the same migration deployments run
+                migrate_schema(cur)
 
                 conn.commit()
-                logging.info("Database table recreated successfully")
+                logging.info("Database tables recreated successfully")
 
         return "Cleanup completed successfully"
 
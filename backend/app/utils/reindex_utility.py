@@ -0,0 +1,323 @@
+# reindex_utility.py
+import argparse
+import mimetypes
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import List, Optional
+from dotenv import load_dotenv
+from azure.storage.blob import BlobServiceClient
+from app.routes.upload_document import DocumentProcessor, index_document_text
+from app.services.blob_service import (
+    EXTRACTED_TEXT_CONTAINER,
+    upload_extracted_text,
+    download_blob,
+    download_extracted_text
+)
+from app.services.ingestion_service import (
+    create_ingestion_document,
+    list_latest_documents,
+    refresh_document_status,
+    set_text_blob_name
+)
+from app.services.schema_service import verify_schema
+from app.services.vector_service import (
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_EMBEDDING_MODEL,
+    MODEL_DIMENSIONS,
+    get_active_index,
+    get_embedding_index,
+    register_embedding_index,
+    activate_embedding_index,
+    list_indexed_documents
+)
+
+# Load environment variables
+load_dotenv()
+
+# Container holding the original uploads
+DOCUMENTS_CONTAINER = "documents"
+
+# Catch-up passes for documents uploaded into the old index while the new one builds
+MAX_CATCH_UP_PASSES = 3
+
+def extract_original_text(blob_service_client, processor: DocumentProcessor, document_name: str, file_type: Optional[str]) -> str:
+    """Extract text from the original upload and keep it as an artifact. Returns the text blob name."""
+    if not file_type:
+        file_type, _ = mimetypes.guess_type(document_name)
+
+    documents_container_client = blob_service_client.get_container_client(DOCUMENTS_CONTAINER)
+    file_content = download_blob(documents_container_client, document_name)
+    text_content = processor.extract_text_from_file(file_content, file_type or 'application/octet-stream')
+
+    text_container_client = blob_service_client.get_container_client(EXTRACTED_TEXT_CONTAINER)
+    return upload_extracted_text(text_container_client, document_name, text_content)
+
+def register_legacy_documents(blob_service_client, processor: DocumentProcessor, index: dict) -> List[str]:
+    """
+    Give documents indexed before ingestion records existed a record and a text
+    artifact, extracting their text once from the original upload, so the re-index
+    treats them like every other document. Returns the names that could not be registered.
+    """
+    known = {document["document_name"] for document in list_latest_documents()}
+    legacy = [
+        document for document in list_indexed_documents(index["table_name"])
+        if document["document_name"] not in known
+    ]
+    if not legacy:
+        return []
+
+    logging.info(f"Registering {len(legacy)} documents that predate ingestion records")
+    failed = []
+    for document in legacy:
+        try:
+            text_blob_name = extract_original_text(
+                blob_service_client, processor, document["document_name"], document["file_type"]
+            )
+            document_id = create_ingestion_document(
+                document["document_name"],
+                document["file_type"],
+                document["blob_url"],
+                text_blob_name,
+                index["table_name"],
+                [],
+                created_at=document["uploaded_at"]
+            )
+            refresh_document_status(document_id)
+        except Exception as e:
+            logging.error(f"Error registering {document['document_name']}: {str(e)}")
+            failed.append(document["document_name"])
+
+    return failed
+
+def load_document_text(blob_service_client, processor: DocumentProcessor, document: dict) -> str:
+    """
+    Load the extracted text of a document from its artifact. Ingestion records
+    written before artifacts were kept are extracted once from the original file.
+    """
+    if not document["text_blob_name"]:
+        logging.info(f"No extracted text for {document['document_name']}; extracting from the original file")
+        text_blob_name = extract_original_text(
+            blob_service_client, processor, document["document_name"], document["file_type"]
+        )
+        set_text_blob_name(document["id"], text_blob_name)
+        document = {**document, "text_blob_name": text_blob_name}
+
+    text_container_client = blob_service_client.get_container_client(EXTRACTED_TEXT_CONTAINER)
+    return download_extracted_text(text_container_client, document["text_blob_name"])
+
+def reindex_document(blob_service_client, processor: DocumentProcessor, document: dict, table_name: str):
+    """Re-chunk and re-embed one document into the given embeddings table."""
+    text_content = load_document_text(blob_service_client, processor, document)
+    chunk_count = index_document_text(
+        processor,
+        document_name=document["document_name"],
+        mime_type=document["file_type"],
+        blob_url=document["blob_url"],
+        text_content=text_content,
+        table_name=table_name,
+        uploaded_at=document["created_at"]
+    )
+    logging.info(f"Re-indexed {document['document_name']} into {table_name} ({chunk_count} chunks)")
+
+class ReindexIncompleteError(Exception):
+    """Raised when documents are missing from a re-indexed table."""
+
+    def __init__(self, message: str, table_name: str, missing: List[str]):
+        super().__init__(message)
+        self.table_name = table_name
+        self.missing = missing
+
+def pending_documents(latest_documents: List[dict], table_name: str, indexed: dict) -> List[dict]:
+    """
+    Latest documents still missing from the table. Uploads that already target the
+    table write their own chunks there and are left alone.
+    Args:
+        latest_documents (list): Latest ingestion record of every document
+        table_name (str): Embeddings table being built
+        indexed (dict): Document name -> ingestion id of the copy already in the table
+    """
+    return [
+        document for document in latest_documents
+        if document["index_table"] != table_name and indexed.get(document["document_name"]) != document["id"]
+    ]
+
+def already_indexed(latest_documents: List[dict], table_documents: List[dict]) -> dict:
+    """
+    Documents an interrupted build already stored, matched to their latest ingestion record
+    by upload time, so a newer upload of the same name is still re-indexed.
+    Returns document name -> ingestion id.
+    """
+    uploaded = {document["document_name"]: document["uploaded_at"] for document in table_documents}
+    return {
+        document["document_name"]: document["id"]
+        for document in latest_documents
+        if document["document_name"] in uploaded and uploaded[document["document_name"]] == document["created_at"]
+    }
+
+def reindex_pending(
+    blob_service_client,
+    processor: DocumentProcessor,
+    table_name: str,
+    indexed: dict,
+    max_workers: int
+) -> List[str]:
+    """
+    Re-index every pending document into the table.
+    Updates `indexed` (document name -> ingestion id) and returns the names that failed.
+    """
+    pending = pending_documents(list_latest_documents(), table_name, indexed)
+    if not pending:
+        return []
+
+    logging.info(f"Re-indexing {len(pending)} documents into {table_name}")
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(reindex_document, blob_service_client, processor, document, table_name): document
+            for document in pending
+        }
+        for future, document in futures.items():
+            try:
+                future.result()
+                indexed[document["document_name"]] = document["id"]
+            except Exception as e:
+                logging.error(f"Error re-indexing {document['document_name']}: {str(e)}")
+                failed.append(document["document_name"])
+
+    return failed
+
+def prepare_index(model: str, chunk_size: int, dimensions: Optional[int], resume: Optional[str]) -> dict:
+    """Registers a new embeddings table, or returns the inactive one an earlier run left behind."""
+    if resume:
+        index = get_embedding_index(resume)
+        if not index:
+            raise ValueError(f"No embedding index named {resume} is registered")
+        if index["is_active"]:
+            raise ValueError(f"{resume} is already the active index")
+        logging.info(f"Resuming {resume} ({index['model']}, {index['dimensions']} dimensions, {index['chunk_size']} token chunks)")
+        return index
+
+    dimensions = dimensions or MODEL_DIMENSIONS.get(model)
+    if not dimensions:
+        raise ValueError(f"Unknown dimensions for model {model}; pass them explicitly")
+
+    table_name = f"document_embeddings_{datetime.now(timezone.utc):%Y%m%d%H%M%S}"
+    register_embedding_index(table_name, model, dimensions, chunk_size)
+    logging.info(f"Building {table_name} with {model} ({dimensions} dimensions, {chunk_size} token chunks)")
+    return {"table_name": table_name, "model": model, "dimensions": dimensions, "chunk_size": chunk_size}
+
+def reindex_corpus(
+    model: str = DEFAULT_EMBEDDING_MODEL,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    dimensions: Optional[int] = None,
+    max_workers: int = 4,
+    allow_missing: bool = False,
+    resume: Optional[str] = None
+) -> str:
+    """
+    Build a new embeddings table from the stored extracted text and switch searches over to it.
+
+    The active index keeps serving queries and uploads while the new table is built.
+    Embedding calls run at bulk priority, so queries still go ahead of the job. The
+    switch is a single transaction. Documents uploaded into the old index during the
+    build are picked up before and after the switch. Uploads that are still running
+    at the switch copy themselves into the new index when they finish. A build that
+    fails before the switch keeps its table, and `resume` continues it without
+    re-embedding the documents already stored.
+    Args:
+        model (str): Embedding model for the new index
+        chunk_size (int): Maximum tokens per chunk
+        dimensions (int): Embedding dimensions; defaults to the model's native size
+        max_workers (int): Documents processed in parallel
+        allow_missing (bool): Switch even if some documents in the active index cannot be re-indexed
+        resume (str): Inactive embeddings table from an earlier run to continue building
+    Returns:
+        str: Name of the new, active embeddings table
+    Raises:
+        ReindexIncompleteError: If documents are missing from the new table
+    """
+    connection_string = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+    if not connection_string:
+        raise ValueError("Azure Storage connection string not found in environment variables")
+    blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+
+    verify_schema()
+    previous_index = get_active_index()
+
+    # Text extraction does not depend on the index, so this runs before any table is registered
+    unregistered = register_legacy_documents(
+        blob_service_client, DocumentProcessor.for_index(previous_index), previous_index
+    )
+    if unregistered and not allow_missing:
+        raise ReindexIncompleteError(
+            f"{len(unregistered)} documents in {previous_index['table_name']} could not be extracted "
+            f"from their original files and would disappear from search: {sorted(unregistered)}",
+            previous_index["table_name"],
+            sorted(unregistered)
+        )
+
+    new_index = prepare_index(model, chunk_size, dimensions, resume)
+    table_name = new_index["table_name"]
+    processor = DocumentProcessor.for_index(new_index)
+
+    indexed = already_indexed(list_latest_documents(), list_indexed_documents(table_name)) if resume else {}
+    if indexed:
+        logging.info(f"{len(indexed)} documents are already in {table_name}")
+
+    for _ in range(MAX_CATCH_UP_PASSES):
+        failed = reindex_pending(blob_service_client, processor, table_name, indexed, max_workers)
+        if not pending_documents(list_latest_documents(), table_name, indexed):
+            break
+    if failed:
+        raise ReindexIncompleteError(
+            f"Re-index into {table_name} failed for {len(failed)} documents: {sorted(failed)}. "
+            f"Fix them and continue with --resume {table_name}",
+            table_name,
+            sorted(failed)
+        )
+
+    activate_embedding_index(table_name)
+
+    # Keep catching up until no upload into the previous index is left behind
+    while pending_documents(list_latest_documents(), table_name, indexed):
+        failed = reindex_pending(blob_service_client, processor, table_name, indexed, max_workers)
+        if failed:
+            raise ReindexIncompleteError(
+                f"{table_name} is active but is missing documents uploaded during the switch: {sorted(failed)}. "
+                "Retry or re-upload them",
+                table_name,
+                sorted(failed)
+            )
+
+    return table_name
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-chunk and re-embed every document into a new index")
+    parser.add_argument("--model", default=DEFAULT_EMBEDDING_MODEL)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--dimensions", type=int)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--allow-missing", action="store_true")
+    parser.add_argument("--resume", metavar="TABLE", help="Continue building an inactive index left by an earlier run")
+    args = parser.parse_args()
+
+    try:
+        result = reindex_corpus(
+            model=args.model,
+            chunk_size=args.chunk_size,
+            dimensions=args.dimensions,
+            max_workers=args.workers,
+            allow_missing=args.allow_missing,
+            resume=args.resume
+        )
+        print(f"Active embedding index: {result}")
+    except ReindexIncompleteError as e:
+        print(f"Re-index incomplete: {str(e)}")
+        for document_name in e.missing:
+            print(f"  missing: {document_name}")
+        raise SystemExit(1)
+    except Exception as e:
+        print(f"Error during re-index: {str(e)}")
+        raise SystemExit(1)
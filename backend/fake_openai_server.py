@@ -0,0 +1,151 @@
+"""
+Local stand-in for the OpenAI API, used to exercise the OpenAI scheduler
+without spending quota.
+
+Serves /v1/embeddings and /v1/chat/completions with configurable latency and
+its own requests-per-minute limit. Requests over the limit get a 429 with a
+Retry-After header, just like the real API.
+
+Usage:
+    python fake_openai_server.py --port 8089 --rpm 120 --latency 0.2
+    OPENAI_BASE_URL=http://localhost:8089/v1 OPENAI_API_KEY=fake func start
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import struct
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+EMBEDDING_DIMENSIONS = 1536
+
+
+class RateWindow:
+    """Sliding window of accepted requests (one minute unless a test shortens it)."""
+
+    def __init__(self, max_requests: int, window_seconds: float = 60):
+        self.max_requests = max_requests
+        self.window_seconds = window_seconds
+        self.accepted = deque()
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def try_accept(self):
+        """Returns 0 if the request is accepted, otherwise seconds until a slot frees up."""
+        with self.lock:
+            now = time.monotonic()
+            while self.accepted and now - self.accepted[0] >= self.window_seconds:
+                self.accepted.popleft()
+            if len(self.accepted) < self.max_requests:
+                self.accepted.append(now)
+                return 0
+            self.rejected += 1
+            return self.window_seconds - (now - self.accepted[0])
+
+
+def fake_embedding(text: str) -> list:
+    """Deterministic unit-length vector derived from the input text."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.uniform(-1, 1) for _ in range(EMBEDDING_DIMENSIONS)]
+    norm = sum(v * v for v in vector) ** 0.5
+    return [v / norm for v in vector]
+
+
+def encode_embedding(vector: list, encoding_format: str):
+    """The openai client asks for base64-packed float32 unless told otherwise."""
+    if encoding_format == "base64":
+        return base64.b64encode(struct.pack(f"<{len(vector)}f", *vector)).decode("ascii")
+    return vector
+
+
+def make_handler(window: RateWindow, latency: float, jitter: float):
+    class FakeOpenAIHandler(BaseHTTPRequestHandler):
+        def send_json(self, status: int, payload: dict, headers: dict = None):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+
+            wait = window.try_accept()
+            if wait:
+                self.send_json(
+                    429,
+                    {"error": {"message": "Rate limit reached (fake server)", "type": "requests", "code": "rate_limit_exceeded"}},
+                    {"Retry-After": f"{wait:.2f}"}
+                )
+                return
+
+            time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+            if self.path.endswith("/embeddings"):
+                inputs = request.get("input", "")
+                if isinstance(inputs, str):
+                    inputs = [inputs]
+                # langchain sends token arrays; hash their string form
+                data = [
+                    {
+                        "object": "embedding",
+                        "index": i,
+                        "embedding": encode_embedding(fake_embedding(str(item)), request.get("encoding_format"))
+                    }
+                    for i, item in enumerate(inputs)
+                ]
+                self.send_json(200, {
+                    "object": "list",
+                    "data": data,
+                    "model": request.get("model", "text-embedding-3-small"),
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0}
+                })
+            elif self.path.endswith("/chat/completions"):
+                self.send_json(200, {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "gpt-3.5-turbo"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "This is a response from the fake OpenAI server."},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+                })
+            else:
+                self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        def log_message(self, format, *args):
+            print(f"{self.address_string()} {format % args}")
+
+    return FakeOpenAIHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI API server for local testing")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--rpm", type=int, default=120, help="Requests per minute before returning 429")
+    parser.add_argument("--latency", type=float, default=0.2, help="Base response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Random latency added or removed, in seconds")
+    args = parser.parse_args()
+
+    handler = make_handler(RateWindow(args.rpm), args.latency, args.jitter)
+    server = ThreadingHTTPServer(("localhost", args.port), handler)
+    print(f"Fake OpenAI server listening on http://localhost:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("tiktoken")
+
+from app.routes import upload_document
+from app.routes.upload_document import DocumentChunk, ingest_pending_chunks
+from app.services.ingestion_service import CHUNK_EXTRACTED, CHUNK_EMBEDDED
+
+
+@pytest.fixture
+def ingestion(monkeypatch):
+    """Replace the OpenAI call and the checkpoint writes with recorders; yields (processor, calls)."""
+    calls = {"embedded": [], "saved": [], "stored": [], "failed": []}
+    behaviour = {"save_returns": True, "store_fails_for": set()}
+
+    def generate_embedding(chunk):
+        calls["embedded"].append(chunk.content)
+        return np.zeros(3)
+
+    def save_chunk_embedding(document_id, chunk_idx, embedding):
+        calls["saved"].append(chunk_idx)
+        return behaviour["save_returns"]
+
+    def store_chunk(document_id, chunk_idx, document_name, metadata, table_name):
+        if chunk_idx in behaviour["store_fails_for"]:
+            raise RuntimeError(f"chunk {chunk_idx} could not be stored")
+        calls["stored"].append(chunk_idx)
+
+    def mark_chunk_failed(document_id, chunk_idx, error):
+        calls["failed"].append((chunk_idx, error))
+
+    monkeypatch.setattr(upload_document, "save_chunk_embedding", save_chunk_embedding)
+    monkeypatch.setattr(upload_document, "store_chunk", store_chunk)
+    monkeypatch.setattr(upload_document, "mark_chunk_failed", mark_chunk_failed)
+
+    processor = SimpleNamespace(
+        generate_embedding=generate_embedding,
+        scheduler=SimpleNamespace(max_concurrency=2)
+    )
+    yield processor, calls, behaviour
+
+
+def chunk(idx):
+    return DocumentChunk(content=f"chunk {idx}", start_idx=idx, end_idx=idx + 1, metadata={"chunk_size": 1})
+
+
+def ingest(processor, pending):
+    return ingest_pending_chunks(
+        processor,
+        document_id=1,
+        document_name="report.pdf",
+        mime_type="application/pdf",
+        blob_url="https://example/report.pdf",
+        index_table="document_embeddings",
+        pending=pending
+    )
+
+
+def test_embedded_chunks_skip_the_embedding_call(ingestion):
+    processor, calls, _ = ingestion
+
+    failed = ingest(processor, [(0, chunk(0), CHUNK_EMBEDDED), (1, chunk(1), CHUNK_EXTRACTED)])
+
+    assert failed == []
+    assert calls["embedded"] == ["chunk 1"]
+    assert calls["saved"] == [1]
+    assert sorted(calls["stored"]) == [0, 1]
+
+
+def test_chunk_claimed_by_another_request_is_not_a_failure(ingestion):
+    processor, calls, behaviour = ingestion
+    behaviour["save_returns"] = False
+
+    failed = ingest(processor, [(0, chunk(0), CHUNK_EXTRACTED)])
+
+    assert failed == []
+    assert calls["stored"] == []
+    assert calls["failed"] == []
+
+
+def test_failed_chunks_are_recorded_and_keep_their_checkpoint(ingestion):
+    processor, calls, behaviour = ingestion
+    behaviour["store_fails_for"] = {1}
+
+    failed = ingest(processor, [(0, chunk(0), CHUNK_EXTRACTED), (1, chunk(1), CHUNK_EMBEDDED)])
+
+    assert failed == [1]
+    assert calls["stored"] == [0]
+    assert [chunk_idx for chunk_idx, _ in calls["failed"]] == [1]
+    assert "could not be stored" in calls["failed"][0][1]
+    # The embedded chunk is not embedded again; a retry resumes it from its checkpoint
+    assert calls["embedded"] == ["chunk 0"]
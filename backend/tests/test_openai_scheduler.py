@@ -0,0 +1,149 @@
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+openai = pytest.importorskip("openai")
+
+from app.services.openai_scheduler import OpenAIScheduler, TokenBucket, INTERACTIVE, BULK
+from fake_openai_server import RateWindow, make_handler
+
+
+@pytest.fixture
+def fake_openai():
+    """Start the fake OpenAI server on an ephemeral port; yields (client factory, rate window)."""
+    servers = []
+
+    def start(max_requests=1000, window_seconds=60, latency=0.02):
+        window = RateWindow(max_requests, window_seconds)
+        server = ThreadingHTTPServer(("localhost", 0), make_handler(window, latency, jitter=0))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        client = openai.OpenAI(
+            api_key="fake",
+            base_url=f"http://localhost:{server.server_address[1]}/v1",
+            max_retries=0
+        )
+        return client, window
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def embed(client, text):
+    return client.embeddings.create(input=text, model="text-embedding-3-small")
+
+
+def test_burst_completes_without_surfacing_rate_limits(fake_openai):
+    # The server allows 5 requests per second; the client-side limits are far looser
+    client, window = fake_openai(max_requests=5, window_seconds=1)
+    scheduler = OpenAIScheduler(initial_concurrency=8, max_retries=10, base_backoff=0.05, max_backoff=1.0)
+
+    results, errors = [], []
+
+    def call(i):
+        try:
+            results.append(scheduler.run(lambda: embed(client, f"chunk {i}"), priority=BULK, kind="embeddings"))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+
+    assert errors == []
+    assert len(results) == 20
+    assert all(len(result.data[0].embedding) == 1536 for result in results)
+    # The burst really did hit the server's limit, and the scheduler backed off
+    assert window.rejected > 0
+    assert scheduler.concurrency_limit < 8
+    assert scheduler.in_flight == 0
+
+
+def test_interactive_calls_finish_ahead_of_queued_bulk_calls(fake_openai):
+    client, _ = fake_openai(latency=0.05)
+    scheduler = OpenAIScheduler(initial_concurrency=1, max_concurrency=1)
+
+    finished = []
+    lock = threading.Lock()
+
+    def call(label, priority):
+        scheduler.run(lambda: embed(client, label), priority=priority, kind="embeddings")
+        with lock:
+            finished.append(label)
+
+    bulk = [threading.Thread(target=call, args=("bulk", BULK)) for _ in range(10)]
+    for thread in bulk:
+        thread.start()
+    # Let the bulk calls queue up behind the single slot
+    time.sleep(0.15)
+
+    interactive = [threading.Thread(target=call, args=("interactive", INTERACTIVE)) for _ in range(3)]
+    for thread in interactive:
+        thread.start()
+    for thread in bulk + interactive:
+        thread.join(timeout=30)
+
+    assert len(finished) == 13
+    # Every interactive call overtook the bulk calls still waiting in the queue
+    assert finished[-5:] == ["bulk"] * 5
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(capacity_per_minute=60)
+    now = time.monotonic()
+
+    assert bucket.time_until_available(60, now) == 0
+    bucket.consume(60)
+    assert bucket.time_until_available(1, now) == pytest.approx(1.0, abs=0.01)
+    assert bucket.time_until_available(1, now + 1.0) == 0
+
+
+def test_single_slow_call_does_not_starve_other_kinds():
+    scheduler = OpenAIScheduler(initial_concurrency=8)
+
+    for _ in range(20):
+        scheduler.in_flight += 1
+        scheduler.release(kind="embeddings", latency=0.05)
+    limit = scheduler.concurrency_limit
+
+    # A slow chat completion is judged against chat latency only
+    scheduler.in_flight += 1
+    scheduler.release(kind="chat", latency=3.0)
+    for _ in range(5):
+        scheduler.in_flight += 1
+        scheduler.release(kind="embeddings", latency=0.05)
+
+    assert scheduler.concurrency_limit >= limit
+
+
+def test_rate_limit_halves_concurrency_and_honours_retry_after():
+    scheduler = OpenAIScheduler(initial_concurrency=8)
+
+    scheduler.in_flight += 1
+    scheduler.release(kind="embeddings", rate_limited=True, retry_after=2.0)
+
+    assert scheduler.concurrency_limit == 4
+    assert scheduler.paused_until - time.monotonic() > 1.5
+    assert scheduler.backoff_delay(0, retry_after=2.0) >= 2.0
+
+
+def test_burst_of_concurrent_rate_limits_cuts_only_once():
+    scheduler = OpenAIScheduler(initial_concurrency=8)
+    scheduler.in_flight = 8
+
+    # Every call in flight when the limit is cut was sent at the old limit
+    for _ in range(8):
+        scheduler.release(kind="embeddings", rate_limited=True)
+    assert scheduler.concurrency_limit == 4
+
+    # A call sent after the cut that is still rate limited cuts again
+    scheduler.in_flight += 1
+    scheduler.release(kind="embeddings", rate_limited=True)
+    assert scheduler.concurrency_limit == 2
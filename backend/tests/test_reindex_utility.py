@@ -0,0 +1,55 @@
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("azure.storage.blob")
+pytest.importorskip("tiktoken")
+
+from app.utils.reindex_utility import pending_documents, already_indexed
+
+OLD_TABLE = "document_embeddings"
+NEW_TABLE = "document_embeddings_20240101000000"
+
+
+def document(document_id, name, index_table=OLD_TABLE, created_at=None):
+    return {
+        "id": document_id,
+        "document_name": name,
+        "index_table": index_table,
+        "created_at": created_at or datetime(2024, 1, document_id, tzinfo=timezone.utc)
+    }
+
+
+def test_pending_documents_skips_uploads_already_targeting_the_new_table():
+    latest = [document(1, "a.pdf"), document(2, "b.pdf", index_table=NEW_TABLE)]
+
+    assert [d["document_name"] for d in pending_documents(latest, NEW_TABLE, {})] == ["a.pdf"]
+
+
+def test_pending_documents_skips_documents_already_copied():
+    latest = [document(1, "a.pdf"), document(2, "b.pdf")]
+
+    pending = pending_documents(latest, NEW_TABLE, {"a.pdf": 1})
+
+    assert [d["document_name"] for d in pending] == ["b.pdf"]
+
+
+def test_pending_documents_redoes_documents_uploaded_again_since_the_copy():
+    latest = [document(3, "a.pdf")]
+
+    # The table holds the copy of ingestion record 1; record 3 is a newer upload
+    assert pending_documents(latest, NEW_TABLE, {"a.pdf": 1}) == latest
+
+
+def test_already_indexed_matches_the_latest_upload_by_time():
+    latest = [document(1, "a.pdf"), document(3, "b.pdf")]
+    table_documents = [
+        {"document_name": "a.pdf", "uploaded_at": latest[0]["created_at"]},
+        # Copied from an older upload of b.pdf, so it has to be redone
+        {"document_name": "b.pdf", "uploaded_at": datetime(2024, 1, 2, tzinfo=timezone.utc)}
+    ]
+
+    indexed = already_indexed(latest, table_documents)
+
+    assert indexed == {"a.pdf": 1}
+    assert [d["document_name"] for d in pending_documents(latest, NEW_TABLE, indexed)] == ["b.pdf"]
@@ -0,0 +1,89 @@
+from datetime import datetime, timezone
+
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("langchain_openai")
+
+from app.routes.autocomplete import parse_search_filters
+from app.services.vector_service import build_search_filter
+
+
+def render(clause) -> str:
+    # Plain SQL fragments render without a connection
+    return clause.as_string(None)
+
+
+def test_parse_search_filters_defaults_to_no_filters():
+    assert parse_search_filters({"query": "q"}) == {
+        "document_names": None,
+        "file_types": None,
+        "uploaded_after": None,
+        "uploaded_before": None,
+        "metadata_filter": None
+    }
+
+
+def test_parse_search_filters_reads_every_field():
+    filters = parse_search_filters({
+        "filters": {
+            "documentNames": "report.pdf",
+            "fileTypes": ["application/pdf", "text/plain"],
+            "uploadedAfter": "2024-01-01T00:00:00Z",
+            "uploadedBefore": "2024-02-01T12:30:00+00:00",
+            "metadata": {"author": "finance"}
+        }
+    })
+
+    assert filters["document_names"] == ["report.pdf"]
+    assert filters["file_types"] == ["application/pdf", "text/plain"]
+    assert filters["uploaded_after"] == datetime(2024, 1, 1, tzinfo=timezone.utc)
+    assert filters["uploaded_before"] == datetime(2024, 2, 1, 12, 30, tzinfo=timezone.utc)
+    assert filters["metadata_filter"] == {"author": "finance"}
+
+
+@pytest.mark.parametrize("filters", [
+    "report.pdf",
+    {"documentNames": ["report.pdf", 3]},
+    {"uploadedAfter": "last tuesday"},
+    {"metadata": ["author"]}
+])
+def test_parse_search_filters_rejects_malformed_filters(filters):
+    with pytest.raises(ValueError):
+        parse_search_filters({"filters": filters})
+
+
+def test_build_search_filter_without_filters_is_empty():
+    clause, params = build_search_filter()
+
+    assert render(clause) == ""
+    assert params == []
+
+
+def test_build_search_filter_orders_clauses_and_parameters_together():
+    after = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    before = datetime(2024, 2, 1, tzinfo=timezone.utc)
+
+    clause, params = build_search_filter(
+        document_names=["report.pdf"],
+        file_types=["application/pdf"],
+        uploaded_after=after,
+        uploaded_before=before,
+        metadata_filter={"author": "finance"}
+    )
+
+    assert render(clause) == (
+        "WHERE document_name = ANY(%s) AND file_type = ANY(%s) "
+        "AND uploaded_at >= %s AND uploaded_at < %s AND metadata @> %s"
+    )
+    assert params[:4] == [["report.pdf"], ["application/pdf"], after, before]
+    assert params[4].adapted == {"author": "finance"}
+
+
+def test_build_search_filter_skips_unset_filters():
+    before = datetime(2024, 2, 1, tzinfo=timezone.utc)
+
+    clause, params = build_search_filter(file_types=["text/plain"], uploaded_before=before)
+
+    assert render(clause) == "WHERE file_type = ANY(%s) AND uploaded_at < %s"
+    assert params == [["text/plain"], before]
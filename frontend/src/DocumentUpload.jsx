@@ -48,8 +48,8 @@ function DocumentUpload() {
             throw new Error('Upload failed');
           }
 
-          const result = await response.text();
-          uploadResults[index] = { success: true, message: result };
+          const result = await response.json();
+          uploadResults[index] = { success: true, message: result.message };
         } catch (error) {
           uploadResults[index] = {
             success: false,